@@ -1,17 +1,14 @@
 import streamlit as st
 import pandas as pd
-import json
-import os
-from datetime import datetime
-import plotly.express as px
-import plotly.graph_objects as go
+import sqlite3
 
-# File paths for data storage
-WEIGHTLIFTS_DATA_FILE = "weightlifts_prs.json"
-BENCHMARKS_DATA_FILE = "benchmarks_prs.json"
+import db
+
+# Number of most recent entries shown in the PR history tables by default
+HISTORY_ROW_LIMIT = 200
 
 # Define weightlifting movements
-WEIGHTLIFTS = [
+WEIGHTLIFTS = (
     "Back Squat",
     "Front Squat",
     "Overhead Squat",
@@ -27,10 +24,10 @@ WEIGHTLIFTS = [
     "Power Snatch",
     "Thruster",
     "Sumo Deadlift High Pull"
-]
+)
 
 # Define benchmark workouts
-BENCHMARK_WORKOUTS = [
+BENCHMARK_WORKOUTS = (
     "Fran",
     "Cindy",
     "Murph",
@@ -51,102 +48,134 @@ BENCHMARK_WORKOUTS = [
     "The Seven",
     "Badger",
     "King Kong"
-]
+)
 
-def load_data(filename):
-    """Load data from JSON file"""
-    if os.path.exists(filename):
-        try:
-            with open(filename, 'r') as f:
-                return json.load(f)
-        except (json.JSONDecodeError, IOError) as e:
-            st.error(f"Error loading data from {filename}: {e}")
-            return []
-    return []
+# Filter dropdown options
+WEIGHTLIFTS_WITH_ALL = ("All", *WEIGHTLIFTS)
+BENCHMARK_WORKOUTS_WITH_ALL = ("All", *BENCHMARK_WORKOUTS)
 
-def save_data(data, filename):
-    """Save data to JSON file"""
+@st.cache_resource
+def init_database():
+    """Set up the database, import legacy JSON data and start WAL checkpoints
+    
+    Runs on the first rerun and again after "Clear cache"; every step is safe to repeat.
+    """
+    db.init_database()
     try:
-        with open(filename, 'w') as f:
-            json.dump(data, f, indent=2)
-    except IOError as e:
-        st.error(f"Error saving data to {filename}: {e}")
+        db.migrate_json_to_db()
+    except sqlite3.Error as e:
+        st.error(f"Error importing the legacy JSON files: {e}")
+    db.start_checkpoints()
 
 def add_weightlift_pr(movement, weight, unit, notes=""):
     """Add a new weightlift PR"""
-    data = load_data(WEIGHTLIFTS_DATA_FILE)
-    # Use max ID + 1 to avoid duplicate IDs
-    max_id = max([entry.get("id", 0) for entry in data], default=0)
-    entry = {
-        "id": max_id + 1,
-        "movement": movement,
-        "weight": weight,
-        "unit": unit,
-        "notes": notes,
-        "date": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    }
-    data.append(entry)
-    save_data(data, WEIGHTLIFTS_DATA_FILE)
+    try:
+        db.add_weightlift_pr(movement, weight, unit, notes)
+    except sqlite3.Error as e:
+        st.error(f"Error saving weightlift PR: {e}")
+        return False
+    get_current_prs_weightlifts.clear()
+    build_weightlift_progress_figure.clear()
     return True
 
 def add_benchmark_pr(workout, time_minutes, time_seconds, rounds, reps, notes=""):
     """Add a new benchmark PR"""
-    data = load_data(BENCHMARKS_DATA_FILE)
-    # Use max ID + 1 to avoid duplicate IDs
-    max_id = max([entry.get("id", 0) for entry in data], default=0)
-    entry = {
-        "id": max_id + 1,
-        "workout": workout,
-        "time_minutes": time_minutes,
-        "time_seconds": time_seconds,
-        "rounds": rounds,
-        "reps": reps,
-        "notes": notes,
-        "date": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    }
-    data.append(entry)
-    save_data(data, BENCHMARKS_DATA_FILE)
+    try:
+        db.add_benchmark_pr(workout, time_minutes, time_seconds, rounds, reps, notes)
+    except sqlite3.Error as e:
+        st.error(f"Error saving benchmark PR: {e}")
+        return False
+    get_current_prs_benchmarks.clear()
+    build_benchmark_progress_figure.clear()
     return True
 
+@st.cache_data(show_spinner=False)
 def get_current_prs_weightlifts():
-    """Get current PRs for all weightlifts"""
-    data = load_data(WEIGHTLIFTS_DATA_FILE)
-    if not data:
-        return {}
+    """Get current PRs for all weightlifts, ordered by movement"""
+    return db.get_current_prs_weightlifts()
+
+@st.cache_data(show_spinner=False)
+def get_current_prs_benchmarks():
+    """Get current PRs (best times) for all benchmarks, ordered by workout"""
+    return db.get_current_prs_benchmarks()
+
+@st.cache_data(show_spinner=False)
+def build_weightlift_progress_figure(movement):
+    """Build the progress chart for one movement"""
+    # Imported here so the other tabs never pay for loading plotly
+    import plotly.graph_objects as go
     
-    prs = {}
-    for entry in data:
-        movement = entry["movement"]
-        if movement not in prs or entry["weight"] > prs[movement]["weight"]:
-            prs[movement] = entry
+    df = pd.DataFrame(db.get_weightlift_progress(movement), columns=["date", "weight", "unit"])
+    # db.get_weightlift_progress returns entries already in date order
+    df["date"] = pd.to_datetime(df["date"], format="ISO8601")
     
-    return prs
+    fig = go.Figure(go.Scattergl(
+        x=df["date"],
+        y=df["weight"],
+        mode="lines+markers",
+        name=movement
+    ))
+    fig.update_layout(
+        title=f"{movement} Progress Over Time",
+        xaxis_title="Date",
+        yaxis_title=f"Weight ({df.iloc[0]['unit']})",
+        transition_duration=0,
+        uirevision=movement
+    )
+    return fig
 
-def get_current_prs_benchmarks():
-    """Get current PRs (best times) for all benchmarks"""
-    data = load_data(BENCHMARKS_DATA_FILE)
-    if not data:
-        return {}
+@st.cache_data(show_spinner=False)
+def build_benchmark_progress_figure(workout):
+    """Build the progress chart for one benchmark workout"""
+    import plotly.graph_objects as go
     
-    prs = {}
-    for entry in data:
-        workout = entry["workout"]
-        total_seconds = entry["time_minutes"] * 60 + entry["time_seconds"]
-        
-        if workout not in prs:
-            prs[workout] = entry
-        else:
-            current_total = prs[workout]["time_minutes"] * 60 + prs[workout]["time_seconds"]
-            if total_seconds < current_total and total_seconds > 0:
-                prs[workout] = entry
+    df = pd.DataFrame(db.get_benchmark_progress(workout), columns=["date", "total_seconds"])
+    df["date"] = pd.to_datetime(df["date"], format="ISO8601")
+    
+    fig = go.Figure(go.Scattergl(
+        x=df["date"],
+        y=df["total_seconds"],
+        mode="lines+markers",
+        name=workout
+    ))
+    fig.update_layout(
+        title=f"{workout} Progress Over Time",
+        xaxis_title="Date",
+        yaxis_title="Time (seconds)",
+        transition_duration=0,
+        uirevision=workout
+    )
     
-    return prs
+    # Invert y-axis since lower time is better
+    fig.update_yaxes(autorange="reversed")
+    return fig
+
+def delete_weightlift_pr(entry_id):
+    """Delete a weightlift entry by ID"""
+    try:
+        deleted = db.delete_weightlift_pr(entry_id)
+    except sqlite3.Error as e:
+        st.error(f"Error deleting weightlift entry: {e}")
+        return False
+    if not deleted:
+        st.warning("That entry was already deleted")
+        return False
+    get_current_prs_weightlifts.clear()
+    build_weightlift_progress_figure.clear()
+    return True
 
-def delete_entry(entry_id, filename):
-    """Delete an entry by ID"""
-    data = load_data(filename)
-    data = [entry for entry in data if entry["id"] != entry_id]
-    save_data(data, filename)
+def delete_benchmark_pr(entry_id):
+    """Delete a benchmark entry by ID"""
+    try:
+        deleted = db.delete_benchmark_pr(entry_id)
+    except sqlite3.Error as e:
+        st.error(f"Error deleting benchmark entry: {e}")
+        return False
+    if not deleted:
+        st.warning("That entry was already deleted")
+        return False
+    get_current_prs_benchmarks.clear()
+    build_benchmark_progress_figure.clear()
     return True
 
 # Streamlit App Configuration
@@ -156,6 +185,8 @@ st.set_page_config(
     layout="wide"
 )
 
+init_database()
+
 # Main Title
 st.title("🏋️ CrossFit PR Tracker")
 st.markdown("Track your Personal Records for weightlifts and benchmark workouts")
@@ -168,6 +199,10 @@ tab1, tab2, tab3, tab4 = st.tabs([
     "📈 Progress"
 ])
 
+# Load each history once per rerun and share it across the tabs
+weightlift_data = db.get_weightlifts()
+benchmark_data = db.get_benchmarks()
+
 # Dashboard Tab
 with tab1:
     st.header("Your Current PRs")
@@ -179,7 +214,7 @@ with tab1:
         weightlift_prs = get_current_prs_weightlifts()
         
         if weightlift_prs:
-            for movement, pr in sorted(weightlift_prs.items()):
+            for movement, pr in weightlift_prs.items():
                 st.metric(
                     label=movement,
                     value=f"{pr['weight']} {pr['unit']}",
@@ -193,7 +228,7 @@ with tab1:
         benchmark_prs = get_current_prs_benchmarks()
         
         if benchmark_prs:
-            for workout, pr in sorted(benchmark_prs.items()):
+            for workout, pr in benchmark_prs.items():
                 time_display = f"{pr['time_minutes']}:{pr['time_seconds']:02d}"
                 rounds_display = f" ({pr['rounds']} rounds + {pr['reps']} reps)" if pr.get('rounds', 0) > 0 else ""
                 st.metric(
@@ -228,54 +263,62 @@ with tab2:
             
             if submitted:
                 if weight > 0:
-                    add_weightlift_pr(movement, weight, unit, notes)
-                    st.success(f"✅ Added {weight} {unit} {movement} PR!")
-                    st.rerun()
+                    if add_weightlift_pr(movement, weight, unit, notes):
+                        st.success(f"✅ Added {weight} {unit} {movement} PR!")
+                        st.rerun()
                 else:
                     st.error("Please enter a valid weight")
     
     with col2:
         st.subheader("PR History")
         
-        data = load_data(WEIGHTLIFTS_DATA_FILE)
-        
-        if data:
+        if weightlift_data:
             # Filter by movement
             movement_filter = st.selectbox(
                 "Filter by movement",
-                ["All"] + WEIGHTLIFTS,
+                WEIGHTLIFTS_WITH_ALL,
                 key="weightlift_filter"
             )
             
-            filtered_data = data if movement_filter == "All" else [
-                entry for entry in data if entry["movement"] == movement_filter
+            filtered_data = weightlift_data if movement_filter == "All" else [
+                entry for entry in weightlift_data if entry["movement"] == movement_filter
             ]
             
             if filtered_data:
-                df = pd.DataFrame(filtered_data)
+                df = pd.DataFrame.from_records(
+                    filtered_data,
+                    columns=["id", "date", "movement", "weight", "unit", "notes"]
+                ).astype({"movement": "category", "unit": "category"})
                 df = df.sort_values("date", ascending=False)
+                if len(df) > HISTORY_ROW_LIMIT and not st.checkbox(
+                    f"Show all {len(df)} entries", key="weightlift_show_all"
+                ):
+                    df = df.head(HISTORY_ROW_LIMIT)
                 
                 # Display as table
                 st.dataframe(
-                    df[["date", "movement", "weight", "unit", "notes"]],
+                    df.drop(columns="id"),
                     use_container_width=True,
                     hide_index=True
                 )
                 
                 # Delete functionality
                 st.subheader("Delete Entry")
+                labels = (
+                    df["date"] + " - " + df["movement"].astype(str) + " "
+                    + df["weight"].astype(str) + " " + df["unit"].astype(str)
+                )
                 entry_to_delete = st.selectbox(
                     "Select entry to delete",
-                    options=[(e["id"], f"{e['date']} - {e['movement']} {e['weight']} {e['unit']}") 
-                             for e in filtered_data],
+                    options=list(zip(df["id"].tolist(), labels.tolist())),
                     format_func=lambda x: x[1],
                     key="delete_weightlift"
                 )
                 
                 if st.button("Delete Selected Entry", key="delete_weightlift_btn"):
-                    delete_entry(entry_to_delete[0], WEIGHTLIFTS_DATA_FILE)
-                    st.success("Entry deleted!")
-                    st.rerun()
+                    if delete_weightlift_pr(entry_to_delete[0]):
+                        st.success("Entry deleted!")
+                        st.rerun()
             else:
                 st.info("No entries found for this filter")
         else:
@@ -313,33 +356,40 @@ with tab3:
             
             if submitted:
                 if time_minutes > 0 or time_seconds > 0 or rounds > 0:
-                    add_benchmark_pr(workout, time_minutes, time_seconds, rounds, reps, notes)
-                    st.success(f"✅ Added {workout} PR!")
-                    st.rerun()
+                    if add_benchmark_pr(workout, time_minutes, time_seconds, rounds, reps, notes):
+                        st.success(f"✅ Added {workout} PR!")
+                        st.rerun()
                 else:
                     st.error("Please enter valid time or rounds")
     
     with col2:
         st.subheader("PR History")
         
-        data = load_data(BENCHMARKS_DATA_FILE)
-        
-        if data:
+        if benchmark_data:
             # Filter by workout
             workout_filter = st.selectbox(
                 "Filter by workout",
-                ["All"] + BENCHMARK_WORKOUTS,
+                BENCHMARK_WORKOUTS_WITH_ALL,
                 key="benchmark_filter"
             )
             
-            filtered_data = data if workout_filter == "All" else [
-                entry for entry in data if entry["workout"] == workout_filter
+            filtered_data = benchmark_data if workout_filter == "All" else [
+                entry for entry in benchmark_data if entry["workout"] == workout_filter
             ]
             
             if filtered_data:
-                df = pd.DataFrame(filtered_data)
+                df = pd.DataFrame.from_records(
+                    filtered_data,
+                    columns=["id", "date", "workout", "time_minutes", "time_seconds", "rounds", "reps", "notes"]
+                ).astype({"workout": "category"})
                 df = df.sort_values("date", ascending=False)
-                df["time"] = df.apply(lambda row: f"{row['time_minutes']}:{row['time_seconds']:02d}", axis=1)
+                if len(df) > HISTORY_ROW_LIMIT and not st.checkbox(
+                    f"Show all {len(df)} entries", key="benchmark_show_all"
+                ):
+                    df = df.head(HISTORY_ROW_LIMIT)
+                df = df.assign(
+                    time=df["time_minutes"].astype(str) + ":" + df["time_seconds"].astype(str).str.zfill(2)
+                )
                 
                 # Display as table
                 display_cols = ["date", "workout", "time", "rounds", "reps", "notes"]
@@ -351,23 +401,93 @@ with tab3:
                 
                 # Delete functionality
                 st.subheader("Delete Entry")
+                labels = df["date"] + " - " + df["workout"].astype(str) + " " + df["time"]
                 entry_to_delete = st.selectbox(
                     "Select entry to delete",
-                    options=[(e["id"], f"{e['date']} - {e['workout']} {e['time_minutes']}:{e['time_seconds']:02d}") 
-                             for e in filtered_data],
+                    options=list(zip(df["id"].tolist(), labels.tolist())),
                     format_func=lambda x: x[1],
                     key="delete_benchmark"
                 )
                 
                 if st.button("Delete Selected Entry", key="delete_benchmark_btn"):
-                    delete_entry(entry_to_delete[0], BENCHMARKS_DATA_FILE)
-                    st.success("Entry deleted!")
-                    st.rerun()
+                    if delete_benchmark_pr(entry_to_delete[0]):
+                        st.success("Entry deleted!")
+                        st.rerun()
             else:
                 st.info("No entries found for this filter")
         else:
             st.info("No benchmark PRs recorded yet")
 
+# Progress charts run as fragments so changing the selection only reruns the chart
+@st.fragment
+def show_weightlift_progress(weightlift_data):
+    """Render the progress chart and stats for one weightlift"""
+    movement_for_chart = st.selectbox(
+        "Select movement to track",
+        WEIGHTLIFTS,
+        key="progress_movement"
+    )
+    
+    movement_history = [e for e in weightlift_data if e["movement"] == movement_for_chart]
+    
+    if movement_history:
+        st.plotly_chart(
+            build_weightlift_progress_figure(movement_for_chart),
+            use_container_width=True,
+            key=f"weightlift_progress_{movement_for_chart}",
+            config={"responsive": True}
+        )
+        
+        # Show statistics; entries are in date order
+        first = movement_history[0]
+        latest = movement_history[-1]
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            st.metric("Current PR", f"{latest['weight']} {latest['unit']}")
+        with col2:
+            st.metric("Starting Weight", f"{first['weight']} {first['unit']}")
+        with col3:
+            improvement = latest['weight'] - first['weight']
+            st.metric("Total Improvement", f"+{improvement} {first['unit']}")
+    else:
+        st.info(f"No data recorded for {movement_for_chart} yet")
+
+@st.fragment
+def show_benchmark_progress(benchmark_data):
+    """Render the progress chart and stats for one benchmark workout"""
+    workout_for_chart = st.selectbox(
+        "Select workout to track",
+        BENCHMARK_WORKOUTS,
+        key="progress_benchmark"
+    )
+    
+    workout_history = [e for e in benchmark_data if e["workout"] == workout_for_chart]
+    
+    if workout_history:
+        st.plotly_chart(
+            build_benchmark_progress_figure(workout_for_chart),
+            use_container_width=True,
+            key=f"benchmark_progress_{workout_for_chart}",
+            config={"responsive": True}
+        )
+        
+        # Show statistics; entries are in date order
+        # As on the dashboard, untimed (AMRAP) entries only count when there are no timed ones
+        timed_history = [e for e in workout_history if e["total_seconds"] > 0] or workout_history
+        first = timed_history[0]
+        best = min(timed_history, key=lambda e: e["total_seconds"])
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            st.metric("Best Time", f"{best['time_minutes']}:{best['time_seconds']:02d}")
+        with col2:
+            st.metric("First Attempt", f"{first['time_minutes']}:{first['time_seconds']:02d}")
+        with col3:
+            # Calculate improvement as first time - best time
+            improvement = first["total_seconds"] - best["total_seconds"]
+            st.metric("Time Saved", f"-{improvement}s")
+    else:
+        st.info(f"No data recorded for {workout_for_chart} yet")
+
 # Progress Tab
 with tab4:
     st.header("📈 Progress Tracking")
@@ -375,45 +495,8 @@ with tab4:
     # Weightlifts Progress
     st.subheader("Weightlifting Progress")
     
-    weightlift_data = load_data(WEIGHTLIFTS_DATA_FILE)
-    
     if weightlift_data:
-        movement_for_chart = st.selectbox(
-            "Select movement to track",
-            WEIGHTLIFTS,
-            key="progress_movement"
-        )
-        
-        movement_history = [e for e in weightlift_data if e["movement"] == movement_for_chart]
-        
-        if movement_history:
-            df = pd.DataFrame(movement_history)
-            df["date"] = pd.to_datetime(df["date"])
-            df = df.sort_values("date")
-            
-            # Create line chart
-            fig = px.line(
-                df,
-                x="date",
-                y="weight",
-                title=f"{movement_for_chart} Progress Over Time",
-                markers=True,
-                labels={"weight": f"Weight ({df.iloc[0]['unit']})", "date": "Date"}
-            )
-            
-            st.plotly_chart(fig, use_container_width=True)
-            
-            # Show statistics
-            col1, col2, col3 = st.columns(3)
-            with col1:
-                st.metric("Current PR", f"{df.iloc[-1]['weight']} {df.iloc[-1]['unit']}")
-            with col2:
-                st.metric("Starting Weight", f"{df.iloc[0]['weight']} {df.iloc[0]['unit']}")
-            with col3:
-                improvement = df.iloc[-1]['weight'] - df.iloc[0]['weight']
-                st.metric("Total Improvement", f"+{improvement} {df.iloc[0]['unit']}")
-        else:
-            st.info(f"No data recorded for {movement_for_chart} yet")
+        show_weightlift_progress(weightlift_data)
     else:
         st.info("No weightlifting data recorded yet")
     
@@ -422,63 +505,8 @@ with tab4:
     # Benchmarks Progress
     st.subheader("Benchmark Workout Progress")
     
-    benchmark_data = load_data(BENCHMARKS_DATA_FILE)
-    
     if benchmark_data:
-        workout_for_chart = st.selectbox(
-            "Select workout to track",
-            BENCHMARK_WORKOUTS,
-            key="progress_benchmark"
-        )
-        
-        workout_history = [e for e in benchmark_data if e["workout"] == workout_for_chart]
-        
-        if workout_history:
-            df = pd.DataFrame(workout_history)
-            df["date"] = pd.to_datetime(df["date"])
-            df["total_seconds"] = df["time_minutes"] * 60 + df["time_seconds"]
-            df = df.sort_values("date")
-            
-            # Validate data
-            if df["total_seconds"].isna().any():
-                st.warning("Some entries have invalid time data")
-                df = df.dropna(subset=["total_seconds"])
-            
-            if len(df) == 0:
-                st.info(f"No valid data for {workout_for_chart}")
-            else:
-                # Create line chart
-                fig = px.line(
-                    df,
-                    x="date",
-                    y="total_seconds",
-                    title=f"{workout_for_chart} Progress Over Time",
-                    markers=True,
-                    labels={"total_seconds": "Time (seconds)", "date": "Date"}
-                )
-                
-                # Invert y-axis since lower time is better
-                fig.update_yaxes(autorange="reversed")
-                
-                st.plotly_chart(fig, use_container_width=True)
-                
-                # Show statistics
-                col1, col2, col3 = st.columns(3)
-                with col1:
-                    best_idx = df["total_seconds"].idxmin()
-                    best = df.loc[best_idx]
-                    st.metric("Best Time", f"{int(best['time_minutes'])}:{int(best['time_seconds']):02d}")
-                with col2:
-                    first = df.iloc[0]
-                    st.metric("First Attempt", f"{int(first['time_minutes'])}:{int(first['time_seconds']):02d}")
-                with col3:
-                    # Calculate improvement as first time - best time
-                    best_time = df["total_seconds"].min()
-                    first_time = df.iloc[0]['total_seconds']
-                    improvement = first_time - best_time
-                    st.metric("Time Saved", f"-{int(improvement)}s")
-        else:
-            st.info(f"No data recorded for {workout_for_chart} yet")
+        show_benchmark_progress(benchmark_data)
     else:
         st.info("No benchmark data recorded yet")
 
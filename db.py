@@ -0,0 +1,447 @@
+import sqlite3
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+# SQLite database holding all PR entries
+DATABASE_FILE = "crossfit_prs.db"
+
+# JSON files used for storage before the SQLite backend; imported on first run
+WEIGHTLIFTS_JSON_FILE = "weightlifts_prs.json"
+BENCHMARKS_JSON_FILE = "benchmarks_prs.json"
+
+# Bumped whenever init_database needs to upgrade an existing database
+SCHEMA_VERSION = 5
+
+# Total benchmark time in seconds, used for ranking benchmark PRs
+TOTAL_SECONDS = "(time_minutes * 60 + time_seconds)"
+
+# Table definitions, formatted with the table name; new entries are dated by SQLite
+WEIGHTLIFTS_TABLE = """
+    CREATE TABLE IF NOT EXISTS {name} (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        movement TEXT NOT NULL,
+        weight REAL NOT NULL,
+        unit TEXT NOT NULL,
+        notes TEXT NOT NULL DEFAULT '',
+        date TEXT NOT NULL DEFAULT (datetime('now', 'localtime'))
+    )
+"""
+BENCHMARKS_TABLE = """
+    CREATE TABLE IF NOT EXISTS {name} (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        workout TEXT NOT NULL,
+        time_minutes INTEGER NOT NULL DEFAULT 0,
+        time_seconds INTEGER NOT NULL DEFAULT 0,
+        rounds INTEGER NOT NULL DEFAULT 0,
+        reps INTEGER NOT NULL DEFAULT 0,
+        notes TEXT NOT NULL DEFAULT '',
+        date TEXT NOT NULL DEFAULT (datetime('now', 'localtime'))
+    )
+"""
+
+# Ranking of entries within a movement/workout, best first. On ties the earliest
+# entry is the PR; untimed (AMRAP) benchmark entries rank after timed ones
+WEIGHTLIFT_PR_ORDER = "weight DESC, date, id"
+BENCHMARK_PR_ORDER = f"{TOTAL_SECONDS} = 0, {TOTAL_SECONDS}, date, id"
+
+# History lists sort by date; the current PR triggers read entries in PR order
+INDEXES = (
+    "CREATE INDEX IF NOT EXISTS idx_wl_date ON weightlifts_prs(date)",
+    f"CREATE INDEX IF NOT EXISTS idx_wl_current_pr ON weightlifts_prs(movement, {WEIGHTLIFT_PR_ORDER})",
+    "CREATE INDEX IF NOT EXISTS idx_bm_date ON benchmarks_prs(date)",
+    f"CREATE INDEX IF NOT EXISTS idx_bm_current_pr ON benchmarks_prs(workout, {BENCHMARK_PR_ORDER})",
+)
+
+# The current PR entry per movement/workout, kept up to date by CURRENT_PR_TRIGGERS
+CURRENT_PR_TABLES = (
+    "CREATE TABLE IF NOT EXISTS current_prs_weightlifts "
+    "(movement TEXT PRIMARY KEY, pr_id INTEGER NOT NULL)",
+    "CREATE TABLE IF NOT EXISTS current_prs_benchmarks "
+    "(workout TEXT PRIMARY KEY, pr_id INTEGER NOT NULL)",
+)
+
+# Re-rank only the movement/workout an inserted or deleted entry belongs to
+CURRENT_PR_TRIGGERS = tuple(
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {table}_{event.lower()}_current_pr
+    AFTER {event} ON {table} BEGIN
+        DELETE FROM current_prs_{kind} WHERE {key} = {row}.{key};
+        INSERT INTO current_prs_{kind} ({key}, pr_id)
+        SELECT {key}, id FROM {table} WHERE {key} = {row}.{key}
+        ORDER BY {order} LIMIT 1;
+    END
+    """
+    for table, kind, key, order in (
+        ("weightlifts_prs", "weightlifts", "movement", WEIGHTLIFT_PR_ORDER),
+        ("benchmarks_prs", "benchmarks", "workout", BENCHMARK_PR_ORDER),
+    )
+    for event, row in (("INSERT", "NEW"), ("DELETE", "OLD"))
+)
+
+# Fills the current PR tables from scratch, for databases created before them
+REFRESH_CURRENT_PRS = (
+    "DELETE FROM current_prs_weightlifts",
+    f"""
+    INSERT INTO current_prs_weightlifts (movement, pr_id)
+    SELECT movement, id FROM (
+        SELECT movement, id, ROW_NUMBER() OVER (
+            PARTITION BY movement ORDER BY {WEIGHTLIFT_PR_ORDER}
+        ) AS rank
+        FROM weightlifts_prs
+    )
+    WHERE rank = 1
+    """,
+    "DELETE FROM current_prs_benchmarks",
+    f"""
+    INSERT INTO current_prs_benchmarks (workout, pr_id)
+    SELECT workout, id FROM (
+        SELECT workout, id, ROW_NUMBER() OVER (
+            PARTITION BY workout ORDER BY {BENCHMARK_PR_ORDER}
+        ) AS rank
+        FROM benchmarks_prs
+    )
+    WHERE rank = 1
+    """,
+)
+
+# Statements used on every rerun or write, kept as constants so sqlite3's
+# statement cache reuses the compiled form instead of re-parsing them
+SQL_INSERT_WEIGHTLIFT = (
+    "INSERT INTO weightlifts_prs (movement, weight, unit, notes) VALUES (?, ?, ?, ?) "
+    "RETURNING id, date"
+)
+SQL_INSERT_BENCHMARK = (
+    "INSERT INTO benchmarks_prs "
+    "(workout, time_minutes, time_seconds, rounds, reps, notes) "
+    "VALUES (?, ?, ?, ?, ?, ?) RETURNING id, date"
+)
+# Bulk imports parse the whole JSON array inside SQLite; entry IDs are not
+# kept since older JSON files could contain duplicates
+SQL_BULK_INSERT_WEIGHTLIFTS = """
+    INSERT INTO weightlifts_prs (movement, weight, unit, notes, date)
+    SELECT
+        json_extract(value, '$.movement'),
+        json_extract(value, '$.weight'),
+        coalesce(json_extract(value, '$.unit'), 'lbs'),
+        coalesce(json_extract(value, '$.notes'), ''),
+        json_extract(value, '$.date')
+    FROM json_each(?)
+"""
+SQL_BULK_INSERT_BENCHMARKS = """
+    INSERT INTO benchmarks_prs (workout, time_minutes, time_seconds, rounds, reps, notes, date)
+    SELECT
+        json_extract(value, '$.workout'),
+        coalesce(json_extract(value, '$.time_minutes'), 0),
+        coalesce(json_extract(value, '$.time_seconds'), 0),
+        coalesce(json_extract(value, '$.rounds'), 0),
+        coalesce(json_extract(value, '$.reps'), 0),
+        coalesce(json_extract(value, '$.notes'), ''),
+        json_extract(value, '$.date')
+    FROM json_each(?)
+"""
+SQL_GET_WEIGHTLIFTS = (
+    "SELECT id, movement, weight, unit, notes, date FROM weightlifts_prs ORDER BY date, id"
+)
+SQL_GET_WEIGHTLIFT_PROGRESS = (
+    "SELECT date, weight, unit FROM weightlifts_prs WHERE movement = ? ORDER BY date, id"
+)
+SQL_GET_BENCHMARKS = (
+    "SELECT id, workout, time_minutes, time_seconds, rounds, reps, notes, date, "
+    f"{TOTAL_SECONDS} AS total_seconds FROM benchmarks_prs ORDER BY date, id"
+)
+SQL_GET_BENCHMARK_PROGRESS = (
+    f"SELECT date, {TOTAL_SECONDS} AS total_seconds FROM benchmarks_prs "
+    "WHERE workout = ? ORDER BY date, id"
+)
+SQL_GET_CURRENT_PRS_WEIGHTLIFTS = """
+    SELECT w.id, w.movement, w.weight, w.unit, w.date
+    FROM current_prs_weightlifts c JOIN weightlifts_prs w ON w.id = c.pr_id
+    ORDER BY c.movement
+"""
+SQL_GET_CURRENT_PRS_BENCHMARKS = """
+    SELECT b.id, b.workout, b.time_minutes, b.time_seconds, b.rounds, b.reps, b.date
+    FROM current_prs_benchmarks c JOIN benchmarks_prs b ON b.id = c.pr_id
+    ORDER BY c.workout
+"""
+SQL_DELETE_WEIGHTLIFT = "DELETE FROM weightlifts_prs WHERE id = ?"
+SQL_DELETE_BENCHMARK = "DELETE FROM benchmarks_prs WHERE id = ?"
+
+# Per-connection settings; journal_mode=WAL is persistent and set in init_database
+CONNECTION_PRAGMAS = (
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-64000",
+    "PRAGMA mmap_size=268435456",
+)
+
+# Seconds between background WAL checkpoints, and pages freed per incremental vacuum
+CHECKPOINT_INTERVAL = 60
+VACUUM_PAGES = 100
+
+# One connection for the whole process, kept open across reruns (Streamlit runs
+# every rerun in a new thread); _lock gives one thread at a time access to it
+_conn = None
+_lock = threading.RLock()
+
+# The run_checkpoints thread, once start_checkpoints has started it
+_checkpoint_thread = None
+
+@contextmanager
+def connection():
+    """Hold the shared connection to the PR database, opening it on first use"""
+    global _conn
+    with _lock:
+        if _conn is None:
+            _conn = sqlite3.connect(DATABASE_FILE, check_same_thread=False)
+            _conn.row_factory = sqlite3.Row
+            for pragma in CONNECTION_PRAGMAS:
+                _conn.execute(pragma)
+        yield _conn
+
+@contextmanager
+def batch():
+    """Run several writes in one transaction, committed when the block exits
+    
+    Pass the yielded connection to add_*_pr to include them in the batch.
+    """
+    with connection() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.rollback()
+            raise
+        conn.commit()
+
+def init_database():
+    """Create tables and indexes, upgrading an existing database to SCHEMA_VERSION"""
+    with connection() as conn:
+        # Incremental auto-vacuum lets deleted pages be reclaimed; an existing file
+        # only switches over after a full VACUUM, which can't run in a transaction
+        if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+            conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+            conn.execute("VACUUM")
+        
+        with conn:
+            cursor = conn.cursor()
+            
+            # WAL keeps readers from blocking on writers and makes commits cheaper
+            cursor.execute("PRAGMA journal_mode=WAL")
+            cursor.execute(WEIGHTLIFTS_TABLE.format(name="weightlifts_prs"))
+            cursor.execute(BENCHMARKS_TABLE.format(name="benchmarks_prs"))
+            
+            user_version = cursor.execute("PRAGMA user_version").fetchone()[0]
+            if 0 < user_version < 3:
+                # SQLite can only add the date default by rebuilding the table
+                rebuild_table(cursor, "weightlifts_prs", WEIGHTLIFTS_TABLE)
+                rebuild_table(cursor, "benchmarks_prs", BENCHMARKS_TABLE)
+            if user_version < 2:
+                # Superseded by the indexes below
+                cursor.execute("DROP INDEX IF EXISTS idx_wl_movement")
+                cursor.execute("DROP INDEX IF EXISTS idx_bm_workout")
+            if user_version < 5:
+                # Did not cover the full PR order, so the triggers had to sort
+                cursor.execute("DROP INDEX IF EXISTS idx_wl_movement_weight")
+                cursor.execute("DROP INDEX IF EXISTS idx_bm_workout_total")
+            for index in INDEXES:
+                cursor.execute(index)
+            for statement in CURRENT_PR_TABLES + CURRENT_PR_TRIGGERS:
+                cursor.execute(statement)
+            if 0 < user_version < 4:
+                for statement in REFRESH_CURRENT_PRS:
+                    cursor.execute(statement)
+            
+            # A new database stays at 0 until migrate_json_to_db succeeds
+            if 0 < user_version < SCHEMA_VERSION:
+                cursor.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+            
+            # Refresh planner statistics so the indexes above get used
+            cursor.execute("ANALYZE")
+
+def checkpoint():
+    """Copy the WAL back into the database file and reclaim free pages"""
+    with connection() as conn:
+        # PASSIVE never waits on readers or writers, so sessions are not held up
+        conn.execute("PRAGMA wal_checkpoint(PASSIVE)")
+        # incremental_vacuum frees one page per step and execute() only steps once
+        conn.executescript(f"PRAGMA incremental_vacuum({VACUUM_PAGES})")
+
+def run_checkpoints():
+    """Run checkpoint() every CHECKPOINT_INTERVAL seconds, forever"""
+    while True:
+        time.sleep(CHECKPOINT_INTERVAL)
+        try:
+            checkpoint()
+        except sqlite3.Error:
+            # Busy or locked; try again on the next interval
+            pass
+
+def start_checkpoints():
+    """Move WAL checkpoints off the commit path onto a background daemon thread
+    
+    Safe to call repeatedly; the thread is only started once per process.
+    """
+    global _checkpoint_thread
+    with connection() as conn:
+        if _checkpoint_thread is not None and _checkpoint_thread.is_alive():
+            return
+        # Commits stop checkpointing once the WAL passes 1000 pages; only
+        # run_checkpoints does it from here on
+        conn.execute("PRAGMA wal_autocheckpoint=0")
+        # Truncate the WAL back to 64 MB whenever it restarts after a burst of writes
+        conn.execute("PRAGMA journal_size_limit=67108864")
+        _checkpoint_thread = threading.Thread(
+            target=run_checkpoints, name="db-checkpoints", daemon=True
+        )
+        _checkpoint_thread.start()
+
+def rebuild_table(cursor, name, table_sql):
+    """Recreate a table from its current definition, keeping its rows and ID sequence"""
+    cursor.execute(table_sql.format(name=f"new_{name}"))
+    # Read only now: sqlite_sequence doesn't exist until an AUTOINCREMENT table
+    # does, and the first schema version used a plain INTEGER PRIMARY KEY
+    seq = cursor.execute("SELECT seq FROM sqlite_sequence WHERE name = ?", (name,)).fetchone()
+    cursor.execute(f"INSERT INTO new_{name} SELECT * FROM {name}")
+    cursor.execute(f"DROP TABLE {name}")
+    cursor.execute(f"ALTER TABLE new_{name} RENAME TO {name}")
+    
+    # Copying only restores the sequence up to the highest remaining ID, so
+    # IDs of deleted entries would be handed out again
+    if seq is not None:
+        cursor.execute(
+            "UPDATE sqlite_sequence SET seq = max(seq, ?) WHERE name = ?", (seq[0], name)
+        )
+        if cursor.rowcount == 0:
+            cursor.execute(
+                "INSERT INTO sqlite_sequence (name, seq) VALUES (?, ?)", (name, seq[0])
+            )
+
+def read_json(filename):
+    """Read the JSON text of a legacy file, or an empty list if it is missing"""
+    if not os.path.exists(filename):
+        return "[]"
+    with open(filename, 'r') as f:
+        return f.read()
+
+def migrate_json_to_db():
+    """Copy entries from the legacy JSON files into a new database, once
+    
+    Raises sqlite3.Error if a file can't be imported (malformed JSON or an
+    entry without a date). Nothing is kept and the database stays at
+    user_version 0, so the import is tried again on the next call.
+    """
+    with batch() as conn:
+        if conn.execute("PRAGMA user_version").fetchone()[0] != 0:
+            return
+        bulk_insert_weightlifts(read_json(WEIGHTLIFTS_JSON_FILE), conn)
+        bulk_insert_benchmarks(read_json(BENCHMARKS_JSON_FILE), conn)
+        conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        conn.execute("ANALYZE")
+
+def bulk_insert_weightlifts(entries_json, conn=None):
+    """Insert a JSON array of dated weightlift entries in one statement"""
+    with batch() if conn is None else nullcontext(conn) as conn:
+        conn.execute(SQL_BULK_INSERT_WEIGHTLIFTS, (entries_json,))
+
+def bulk_insert_benchmarks(entries_json, conn=None):
+    """Insert a JSON array of dated benchmark entries in one statement"""
+    with batch() if conn is None else nullcontext(conn) as conn:
+        conn.execute(SQL_BULK_INSERT_BENCHMARKS, (entries_json,))
+
+def add_weightlift_pr(movement, weight, unit, notes="", conn=None):
+    """Add a new weightlift PR, as part of conn's open batch if given
+    
+    Returns the new entry's id and date.
+    """
+    with batch() if conn is None else nullcontext(conn) as conn:
+        row = conn.execute(SQL_INSERT_WEIGHTLIFT, (movement, weight, unit, notes)).fetchone()
+    return dict(row) if row else None
+
+def add_benchmark_pr(workout, time_minutes, time_seconds, rounds, reps, notes="", conn=None):
+    """Add a new benchmark PR, as part of conn's open batch if given
+    
+    Returns the new entry's id and date.
+    """
+    with batch() if conn is None else nullcontext(conn) as conn:
+        row = conn.execute(
+            SQL_INSERT_BENCHMARK, (workout, time_minutes, time_seconds, rounds, reps, notes)
+        ).fetchone()
+    return dict(row) if row else None
+
+def fetch_dicts(sql, params=()):
+    """Run a query and return its rows as a list of dicts"""
+    with connection() as conn:
+        cursor = conn.cursor()
+        # Plain tuples zipped with the column names skip building a sqlite3.Row per row
+        cursor.row_factory = None
+        cursor.execute(sql, params)
+        columns = [description[0] for description in cursor.description]
+        return [dict(zip(columns, row)) for row in cursor]
+
+def get_weightlifts():
+    """Get all weightlift entries in the order they were recorded"""
+    return fetch_dicts(SQL_GET_WEIGHTLIFTS)
+
+def get_weightlift_progress(movement):
+    """Get the date, weight and unit of each entry for one movement, in date order"""
+    return fetch_dicts(SQL_GET_WEIGHTLIFT_PROGRESS, (movement,))
+
+def get_benchmarks():
+    """Get all benchmark entries in the order they were recorded
+    
+    Each entry also carries its total time as total_seconds.
+    """
+    return fetch_dicts(SQL_GET_BENCHMARKS)
+
+def get_benchmark_progress(workout):
+    """Get the date and total_seconds of each entry for one workout, in date order"""
+    return fetch_dicts(SQL_GET_BENCHMARK_PROGRESS, (workout,))
+
+def get_current_prs_weightlifts():
+    """Get the heaviest entry for each movement, ordered by movement
+    
+    On ties the earliest entry is the PR.
+    """
+    return {entry["movement"]: entry for entry in fetch_dicts(SQL_GET_CURRENT_PRS_WEIGHTLIFTS)}
+
+def get_current_prs_benchmarks():
+    """Get the fastest entry for each workout, ordered by workout
+    
+    Entries without a time (AMRAP results) only count when a workout has
+    no timed entries at all. On ties the earliest entry is the PR.
+    """
+    return {entry["workout"]: entry for entry in fetch_dicts(SQL_GET_CURRENT_PRS_BENCHMARKS)}
+
+def delete_weightlift_prs(entry_ids):
+    """Delete several weightlift entries by ID in a single transaction
+    
+    Returns how many entries were actually deleted.
+    """
+    with batch() as conn:
+        cursor = conn.executemany(
+            SQL_DELETE_WEIGHTLIFT,
+            [(entry_id,) for entry_id in entry_ids]
+        )
+    return cursor.rowcount
+
+def delete_weightlift_pr(entry_id):
+    """Delete a weightlift entry by ID, returning whether it existed"""
+    return delete_weightlift_prs([entry_id]) > 0
+
+def delete_benchmark_prs(entry_ids):
+    """Delete several benchmark entries by ID in a single transaction
+    
+    Returns how many entries were actually deleted.
+    """
+    with batch() as conn:
+        cursor = conn.executemany(
+            SQL_DELETE_BENCHMARK,
+            [(entry_id,) for entry_id in entry_ids]
+        )
+    return cursor.rowcount
+
+def delete_benchmark_pr(entry_id):
+    """Delete a benchmark entry by ID, returning whether it existed"""
+    return delete_benchmark_prs([entry_id]) > 0